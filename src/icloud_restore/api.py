@@ -2,13 +2,19 @@
 
 import asyncio
 import json
+import math
+import os
+import random
 import time
+from array import array
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, Awaitable
+from typing import Callable, Awaitable, Iterable
 from urllib.parse import urlencode
 
 import httpx
+import orjson
+import xxhash
 
 from .browser import Credentials
 
@@ -17,11 +23,19 @@ from .browser import Credentials
 BASE_URL = "https://p107-docws.icloud.com"
 
 # Tuning parameters
-RESTORE_BATCH_SIZE = 100   # Files per restore request
-CONCURRENT_RESTORES = 5    # Parallel restore requests
+RESTORE_BATCH_SIZE = 250   # Files per restore request (halved per batch on 400/413)
+CONCURRENT_RESTORES = 15   # Parallel restore requests (upper bound)
+MIN_CONCURRENT_RESTORES = 2  # Floor when backing off on errors
+CONCURRENCY_RAMP_EVERY = 10  # Clean batches before adding a permit
 FETCH_PAGE_SIZE = 2000     # Files per list request
 MAX_RETRIES = 5            # Retries per batch
+MAX_THROTTLE_RETRIES = 10  # Extra retries for HTTP 429 (don't use up MAX_RETRIES)
 RETRY_DELAY = 2            # Base delay (exponential backoff)
+FLUSH_EVERY_IDS = 2000     # Save progress after this many newly restored files
+FLUSH_INTERVAL = 30.0      # ...or after this many seconds with unsaved changes
+SNAPSHOT_EVERY = 10        # Also write the full JSON snapshot every Nth save
+MAX_RETRY_DELAY = 30.0     # Cap on computed backoff
+MAX_RETRY_AFTER = 120.0    # Cap on server-requested Retry-After waits
 
 
 class AuthExpiredError(Exception):
@@ -29,6 +43,73 @@ class AuthExpiredError(Exception):
     pass
 
 
+class ConcurrencyController:
+    """Semaphore-like limiter whose permit count adapts to the error rate.
+
+    Halves the number of permits on a retryable error and adds one back
+    after every `ramp_every` successful batches, up to `maximum`.
+    """
+
+    def __init__(
+        self,
+        maximum: int,
+        minimum: int = MIN_CONCURRENT_RESTORES,
+        ramp_every: int = CONCURRENCY_RAMP_EVERY,
+    ):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.ramp_every = ramp_every
+        self.current_permits = maximum
+        self._in_use = 0
+        self._successes = 0
+        self._since_cut = maximum
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_use < self.current_permits)
+            self._in_use += 1
+
+    async def release(self) -> None:
+        async with self._cond:
+            self._in_use -= 1
+            self._cond.notify_all()
+
+    async def __aenter__(self) -> "ConcurrencyController":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.release()
+
+    async def on_success(self) -> None:
+        """Record a clean batch; additively increase permits per window."""
+        async with self._cond:
+            self._since_cut += 1
+            self._successes += 1
+            if self._successes >= self.ramp_every and self.current_permits < self.maximum:
+                self.current_permits += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    async def on_error(self) -> None:
+        """Record a throttling/server error; halve permits.
+
+        Errors from batches that were already in flight when the last cut
+        happened are ignored, so one burst doesn't collapse straight to the floor.
+        """
+        async with self._cond:
+            self._successes = 0
+            if self._since_cut < self.current_permits:
+                self._since_cut += 1
+                return
+            new_permits = max(self.minimum, self.current_permits // 2)
+            if new_permits < self.current_permits:
+                print(f"  Reducing concurrency to {new_permits}")
+            self.current_permits = new_permits
+            self._since_cut = 0
+
+
 @dataclass
 class RestoreStats:
     """Statistics from a restore operation."""
@@ -61,14 +142,181 @@ def _get_params(creds: Credentials) -> dict:
     }
 
 
-def _parse_cookies(cookie_string: str) -> dict:
-    """Parse cookie header string into dict for httpx."""
-    cookies = {}
-    for item in cookie_string.split('; '):
-        if '=' in item:
-            key, value = item.split('=', 1)
-            cookies[key] = value.strip('"')
-    return cookies
+def _items_url(creds: Credentials) -> str:
+    """Restore endpoint URL with the credential query string pre-encoded."""
+    return f"{BASE_URL}/v1/items?{urlencode(_get_params(creds))}"
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with jitter so throttled batches don't retry in lockstep."""
+    return min(MAX_RETRY_DELAY, RETRY_DELAY * (2 ** attempt) * (0.5 + random.random()))
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    """Seconds requested by a Retry-After header, if present and numeric.
+
+    Clamped to MAX_RETRY_AFTER so a huge value can't park a worker (and its
+    concurrency permit) for hours.
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return min(MAX_RETRY_AFTER, max(0.0, float(value)))
+    except ValueError:
+        return None
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Write to path so a crash leaves either the old or new file, never a partial one."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)  # Loops over partial writes, unlike a bare os.write
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+    # Persist the rename itself (directories can't be opened on Windows)
+    if os.name == "posix":
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _atomic_write_json(path: Path, obj) -> None:
+    """Atomically write obj to path as JSON."""
+    _atomic_write_bytes(path, orjson.dumps(obj))
+
+
+def _id_hash(item_id: str) -> int:
+    """64-bit digest used to remember restored IDs compactly."""
+    return xxhash.xxh64_intdigest(item_id.encode())
+
+
+def _hashes_file(progress_file: Path) -> Path:
+    """Packed uint64 digests of restored IDs for a progress file."""
+    return progress_file.with_suffix(".bin")
+
+
+def _failed_file(progress_file: Path) -> Path:
+    """Append-only JSONL of IDs that failed and aren't known to be restored."""
+    return progress_file.with_suffix(".failed.jsonl")
+
+
+def _write_snapshot(
+    progress_file: Path, item_ids: list[str], packed: array, failed_ids: list[str]
+) -> None:
+    """Write the full-fidelity progress file, with restored IDs spelled out.
+
+    Covers the IDs of the current run; digests from earlier runs that
+    aren't in this list stay in the .bin file only.
+    """
+    restored = set(packed)
+    _atomic_write_json(progress_file, {
+        "restored_ids": [id for id in item_ids if _id_hash(id) in restored],
+        "failed_ids": [id for id in failed_ids if _id_hash(id) not in restored],
+    })
+
+
+def _load_failed_ids(failed_file: Path) -> set[str]:
+    """Read the failure log, skipping a line torn by a crash mid-append."""
+    failed_ids = set()
+    for line in failed_file.read_bytes().splitlines():
+        try:
+            failed_ids.add(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            pass
+    return failed_ids
+
+
+_OK_PREFIX = b'{"drive_items_with_status":[{"status_code":'
+
+
+def _is_ok_response(body: bytes) -> bool:
+    """Cheap check that a restore response's first item status is 200.
+
+    Only matches when the body starts with the top-level
+    `drive_items_with_status` array and its first item opens with
+    `status_code`, so the value read is exactly the one the full parse
+    checks. Anything else returns False and the caller does a full decode.
+    """
+    if not body.startswith(_OK_PREFIX):
+        return False
+    value = body[len(_OK_PREFIX):len(_OK_PREFIX) + 6]
+    if value.startswith(b'"200"'):
+        return True
+    return value.startswith(b"200") and value[3:4] in (b",", b"}")
+
+
+def _ids_file(checkpoint_file: Path) -> Path:
+    """Append-only JSONL file holding the item IDs for a fetch checkpoint."""
+    return checkpoint_file.with_suffix(".jsonl")
+
+
+def _load_fetch_checkpoint(checkpoint_file: Path) -> tuple[list[str], str | None, int]:
+    """Load fetched IDs and pagination state, migrating legacy checkpoints.
+
+    The checkpoint file only holds the continuation marker, page number and
+    the byte length of the IDs file at that point. Anything appended to the
+    IDs file after the last checkpoint (a crash mid-page) is truncated away,
+    since that page will be fetched again.
+
+    Returns:
+        (item_ids, continuation_marker, page)
+    """
+    ids_file = _ids_file(checkpoint_file)
+
+    try:
+        checkpoint = orjson.loads(checkpoint_file.read_bytes())
+    except (FileNotFoundError, json.JSONDecodeError):
+        ids_file.unlink(missing_ok=True)
+        return [], None, 0
+
+    continuation_marker = checkpoint.get("continuation_marker")
+    page = checkpoint.get("page", 0)
+
+    # Legacy format: every ID stored inline in the checkpoint JSON
+    if "item_ids" in checkpoint:
+        item_ids = checkpoint["item_ids"]
+        data = _encode_ids(item_ids)
+        ids_file.write_bytes(data)
+        _atomic_write_json(checkpoint_file, {
+            "continuation_marker": continuation_marker,
+            "page": page,
+            "ids_bytes": len(data),
+        })
+        return item_ids, continuation_marker, page
+
+    ids_bytes = checkpoint.get("ids_bytes", 0)
+    try:
+        data = ids_file.read_bytes()
+    except FileNotFoundError:
+        data = b""
+    if len(data) < ids_bytes:
+        # IDs file lost or damaged - start the fetch over
+        ids_file.unlink(missing_ok=True)
+        return [], None, 0
+    if len(data) > ids_bytes:
+        os.truncate(ids_file, ids_bytes)
+        data = data[:ids_bytes]
+
+    item_ids = [orjson.loads(line) for line in data.splitlines()]
+    return item_ids, continuation_marker, page
+
+
+def _encode_ids(item_ids: Iterable[str]) -> bytes:
+    """Serialize IDs as JSONL, one JSON string per line."""
+    return b"".join(orjson.dumps(id) + b"\n" for id in item_ids)
+
+
+def clear_checkpoint(checkpoint_file: Path) -> None:
+    """Remove a fetch checkpoint and its IDs file."""
+    checkpoint_file.unlink(missing_ok=True)
+    _ids_file(checkpoint_file).unlink(missing_ok=True)
 
 
 async def fetch_deleted_files(
@@ -77,6 +325,9 @@ async def fetch_deleted_files(
 ) -> list[str]:
     """Fetch all deleted file IDs from iCloud.
 
+    IDs are appended to a JSONL file next to the checkpoint as each page
+    arrives, so checkpointing costs O(page) rather than O(total).
+
     Args:
         creds: Authentication credentials
         checkpoint_file: File to save/resume progress
@@ -87,64 +338,78 @@ async def fetch_deleted_files(
     Raises:
         AuthExpiredError: If authentication has expired
     """
-    all_item_ids = []
-    continuation_marker = None
-    page = 0
-
     # Try to resume from checkpoint
-    if checkpoint_file.exists():
-        try:
-            checkpoint = json.loads(checkpoint_file.read_text())
-            all_item_ids = checkpoint.get("item_ids", [])
-            continuation_marker = checkpoint.get("continuation_marker")
-            page = checkpoint.get("page", 0)
-            if all_item_ids:
-                print(f"  Resuming from checkpoint: {len(all_item_ids)} IDs, page {page}")
-        except (json.JSONDecodeError, KeyError):
-            pass
-
-    cookies = _parse_cookies(creds.cookies)
+    all_item_ids, continuation_marker, page = _load_fetch_checkpoint(checkpoint_file)
+    if all_item_ids:
+        print(f"  Resuming from checkpoint: {len(all_item_ids)} IDs, page {page}")
 
-    async with httpx.AsyncClient(cookies=cookies, timeout=60.0) as client:
-        while True:
-            page += 1
-            params = {
-                **_get_params(creds),
-                "limit": str(FETCH_PAGE_SIZE),
-                "unified_format": "true",
-            }
-            if continuation_marker:
-                params["nextPage"] = continuation_marker
+    cookies = creds.parsed_cookies
+    headers = _get_headers()
 
-            url = f"{BASE_URL}/ws/_all_/list/enumerate/tombstones?{urlencode(params)}"
+    # Only nextPage changes between pages; encode everything else once
+    base_url = f"{BASE_URL}/ws/_all_/list/enumerate/tombstones?" + urlencode({
+        **_get_params(creds),
+        "limit": str(FETCH_PAGE_SIZE),
+        "unified_format": "true",
+    })
 
-            print(f"  Page {page}...", end=" ", flush=True)
+    async def fetch_page(client: httpx.AsyncClient, marker: str | None) -> dict:
+        url = base_url
+        if marker:
+            url += "&" + urlencode({"nextPage": marker})
 
+        try:
+            response = await client.get(url, headers=headers)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (401, 403, 421):
+                raise AuthExpiredError(f"Auth expired (HTTP {e.response.status_code})")
+            raise
+
+        return orjson.loads(response.content)
+
+    def save_page(ids_out, start: int, marker: str | None, page: int) -> None:
+        # Append this page's IDs (those from `start` on), then record the new state
+        ids_out.write(_encode_ids(
+            all_item_ids[i] for i in range(start, len(all_item_ids))
+        ))
+        ids_out.flush()
+        os.fsync(ids_out.fileno())
+        _atomic_write_json(checkpoint_file, {
+            "continuation_marker": marker,
+            "page": page,
+            "ids_bytes": ids_out.tell(),
+        })
+
+    with _ids_file(checkpoint_file).open("ab") as ids_out:
+        async with httpx.AsyncClient(cookies=cookies, timeout=60.0, http2=True) as client:
+            # The next page's request is kept in flight while the current
+            # page is written to disk in a worker thread
+            next_page = asyncio.create_task(fetch_page(client, continuation_marker))
             try:
-                response = await client.get(url, headers=_get_headers())
-                response.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code in (401, 403, 421):
-                    raise AuthExpiredError(f"Auth expired (HTTP {e.response.status_code})")
-                raise
-
-            data = response.json()
-            documents = data.get("documents", [])
-            item_ids = [doc["item_id"] for doc in documents if "item_id" in doc]
-            all_item_ids.extend(item_ids)
-
-            print(f"{len(documents)} files (total: {len(all_item_ids)})")
-
-            # Save checkpoint
-            continuation_marker = data.get("continuationMarker")
-            checkpoint_file.write_text(json.dumps({
-                "item_ids": all_item_ids,
-                "continuation_marker": continuation_marker,
-                "page": page,
-            }))
-
-            if data.get("status") != "MORE_AVAILABLE" or not continuation_marker:
-                break
+                while next_page:
+                    page += 1
+                    print(f"  Page {page}...", end=" ", flush=True)
+
+                    data = await next_page
+                    continuation_marker = data.get("continuationMarker")
+                    if data.get("status") == "MORE_AVAILABLE" and continuation_marker:
+                        next_page = asyncio.create_task(fetch_page(client, continuation_marker))
+                    else:
+                        next_page = None
+
+                    documents = data.get("documents", [])
+                    start = len(all_item_ids)
+                    all_item_ids.extend(doc["item_id"] for doc in documents if "item_id" in doc)
+
+                    print(f"{len(documents)} files (total: {len(all_item_ids)})")
+
+                    await asyncio.to_thread(
+                        save_page, ids_out, start, continuation_marker, page
+                    )
+            finally:
+                if next_page and not next_page.done():
+                    next_page.cancel()
 
     return all_item_ids
 
@@ -154,6 +419,8 @@ async def restore_files(
     item_ids: list[str],
     on_auth_expired: Callable[[], Awaitable[Credentials]],
     progress_file: Path = Path("icloud_restore_progress.json"),
+    concurrency: int = CONCURRENT_RESTORES,
+    batch_size: int = RESTORE_BATCH_SIZE,
 ) -> RestoreStats:
     """Restore deleted files.
 
@@ -161,170 +428,359 @@ async def restore_files(
         creds: Authentication credentials
         item_ids: List of file IDs to restore
         on_auth_expired: Async callback to refresh credentials when expired
-        progress_file: File to save/resume progress
+        progress_file: Periodic full JSON snapshot of progress; restored
+            digests are kept in a .bin sibling, failures in a .failed.jsonl
+            sibling
+        concurrency: Maximum parallel restore requests (reduced on errors)
+        batch_size: Files per restore request
 
     Returns:
         RestoreStats with counts of restored/failed files
     """
-    # Load previous progress
-    restored_ids = []
-    failed_ids = []
-
+    # Load previous progress. Restored IDs are kept only as 64-bit xxhash
+    # digests (8 bytes each); a false match would need ~4 billion files.
+    hashes_file = _hashes_file(progress_file)
+    failed_file = _failed_file(progress_file)
+    restored_hashes: set[int] = set()
+    failed_ids: set[str] = set()
+
+    if hashes_file.exists():
+        packed = array("Q")
+        data = hashes_file.read_bytes()
+        packed.frombytes(data[:len(data) - len(data) % packed.itemsize])
+        restored_hashes.update(packed)
+
+    if failed_file.exists():
+        failed_ids.update(_load_failed_ids(failed_file))
+
+    # The JSON snapshot (all that older versions kept) may know of restores
+    # the digest file doesn't, e.g. after upgrading; fold it in
     if progress_file.exists():
         try:
-            progress = json.loads(progress_file.read_text())
-            restored_ids = progress.get("restored_ids", [])
-            failed_ids = progress.get("failed_ids", [])
-            if restored_ids:
-                print(f"  Resuming: {len(restored_ids)} already restored")
+            progress = orjson.loads(progress_file.read_bytes())
+            restored_hashes.update(map(_id_hash, progress.get("restored_ids", [])))
+            failed_ids.update(progress.get("failed_ids", []))
         except (json.JSONDecodeError, KeyError):
             pass
 
+    if restored_hashes:
+        print(f"  Resuming: {len(restored_hashes)} already restored")
+
+    # Compact the failure log to what's still outstanding (including any
+    # legacy failures) before appending to it for this run
+    failed_ids = {id for id in failed_ids if _id_hash(id) not in restored_hashes}
+    _atomic_write_bytes(failed_file, _encode_ids(failed_ids))
+
+    # Drop empty and repeated IDs (pages can overlap across resumed fetches)
+    present_ids = [id for id in item_ids if id]
+    unique_ids = list(dict.fromkeys(present_ids))
+
+    if len(present_ids) < len(item_ids):
+        print(f"  Skipping {len(item_ids) - len(present_ids)} empty IDs")
+    if len(unique_ids) < len(present_ids):
+        print(f"  Skipping {len(present_ids) - len(unique_ids)} duplicate IDs")
+
     # Filter out already restored
-    restored_set = set(restored_ids)
-    remaining_ids = [id for id in item_ids if id not in restored_set]
+    remaining_ids = [id for id in unique_ids if _id_hash(id) not in restored_hashes]
 
-    if len(remaining_ids) < len(item_ids):
-        print(f"  Skipping {len(item_ids) - len(remaining_ids)} already restored files")
+    if len(remaining_ids) < len(unique_ids):
+        print(f"  Skipping {len(unique_ids) - len(remaining_ids)} already restored files")
+
+    # Previously failed files go last, so they can't derail the probe batch
+    # or hold up files that have never been tried
+    retry_ids = [id for id in remaining_ids if id in failed_ids]
+    if retry_ids:
+        print(f"  Retrying {len(retry_ids)} files that failed before")
+        remaining_ids = [id for id in remaining_ids if id not in failed_ids] + retry_ids
 
     if not remaining_ids:
-        return RestoreStats(restored=len(restored_ids))
+        return RestoreStats(restored=len(restored_hashes))
 
-    batches = [
-        remaining_ids[i:i + RESTORE_BATCH_SIZE]
-        for i in range(0, len(remaining_ids), RESTORE_BATCH_SIZE)
-    ]
-    total_batches = len(batches)
+    total_batches = math.ceil(len(remaining_ids) / batch_size)
 
     print(f"\nRestoring {len(remaining_ids)} files in {total_batches} batches...\n")
 
     stats = RestoreStats()
     lock = asyncio.Lock()
-    semaphore = asyncio.Semaphore(CONCURRENT_RESTORES)
+    controller = ConcurrencyController(concurrency)
     current_creds = creds
-    save_counter = 0
+    # Rebuilt only when credentials are refreshed
+    put_url = _items_url(current_creds)
+    headers = _get_headers()
+    dirty_since_flush = 0
+    last_flush_t = time.monotonic()
     start_time = time.time()
-
-    async def restore_batch(batch: list[str], batch_num: int) -> None:
-        nonlocal current_creds, save_counter
-
-        async with semaphore:
-            cookies = _parse_cookies(current_creds.cookies)
-
-            async with httpx.AsyncClient(cookies=cookies, timeout=60.0) as client:
-                url = f"{BASE_URL}/v1/items?{urlencode(_get_params(current_creds))}"
-                payload = {
-                    "drive_item_update_request": {"is_recover": "true"},
-                    "item_ids": batch,
-                }
-
-                completed = False
-                for attempt in range(MAX_RETRIES):
-                    try:
-                        response = await client.put(
-                            url, headers=_get_headers(), json=payload
-                        )
-                        response.raise_for_status()
-
-                        # Check response body for errors
-                        data = response.json()
+    largest_ok = 0  # Largest batch the server has accepted
+    split_rejected = True  # Split 400/413 batches; off if nothing at all gets through
+    splits = 0
+    too_large = False  # Whether any batch was rejected with 413
+
+    save_lock = asyncio.Lock()  # Keeps snapshots reaching disk in order
+    saves = 0
+
+    async def save_progress(final: bool = False) -> None:
+        nonlocal saves
+        async with save_lock:
+            saves += 1
+            async with lock:
+                packed = array("Q", restored_hashes)
+                failed = [*failed_ids, *stats.failed_ids]
+            # Serializing and fsyncing happen off the event loop
+            await asyncio.to_thread(_atomic_write_bytes, hashes_file, packed.tobytes())
+            # The full snapshot costs a pass over every ID, so it's written
+            # only now and then and at the end
+            if final or saves % SNAPSHOT_EVERY == 0:
+                await asyncio.to_thread(
+                    _write_snapshot, progress_file, unique_ids, packed, failed
+                )
+
+    failed_lock = asyncio.Lock()
+
+    def append_failed(data: bytes) -> None:
+        failed_out.write(data)
+        failed_out.flush()
+        os.fsync(failed_out.fileno())
+
+    async def record_failure(batch: list[str]) -> None:
+        # Failures are appended as they happen rather than re-saved in full
+        stats.failed += len(batch)
+        stats.failed_ids.extend(batch)
+        async with failed_lock:
+            await asyncio.to_thread(append_failed, _encode_ids(batch))
+
+    async def restore_batch(
+        client: httpx.AsyncClient, batch: list[str], batch_num: int
+    ) -> None:
+        nonlocal current_creds, put_url, dirty_since_flush, last_flush_t, largest_ok, splits, too_large
+
+        async with controller:
+            body = orjson.dumps({
+                "drive_item_update_request": {"is_recover": "true"},
+                "item_ids": batch,
+            })
+
+            completed = False
+            split = False
+            attempt = 0
+            throttled = 0
+            while attempt < MAX_RETRIES:
+                try:
+                    response = await client.put(
+                        put_url, headers=headers, content=body
+                    )
+                    response.raise_for_status()
+
+                    # Check response body for errors (skip decoding clean responses)
+                    if _is_ok_response(response.content):
+                        items_status = None
+                    else:
+                        data = orjson.loads(response.content)
                         items_status = data.get("drive_items_with_status", [])
 
-                        if items_status:
-                            status_code = items_status[0].get("status_code", "200")
-                            status_msg = items_status[0].get("status_message", "")
-
-                            if str(status_code) != "200":
-                                if attempt < MAX_RETRIES - 1:
-                                    delay = RETRY_DELAY * (2 ** attempt)
-                                    print(f"  Batch {batch_num}/{total_batches}: {status_code} - retry in {delay}s")
-                                    await asyncio.sleep(delay)
-                                    continue
-                                else:
-                                    stats.failed += len(batch)
-                                    stats.failed_ids.extend(batch)
-                                    print(f"  Batch {batch_num}/{total_batches}: FAILED - {status_msg[:50]}")
-                                    return
-
-                        # Success
-                        stats.restored += len(batch)
-                        async with lock:
-                            restored_ids.extend(batch)
-                        print(f"  Batch {batch_num}/{total_batches}: OK ({stats.restored} restored)")
-                        completed = True
+                    if items_status:
+                        status_code = items_status[0].get("status_code", "200")
+                        status_msg = items_status[0].get("status_message", "")
+
+                        if str(status_code) != "200":
+                            await controller.on_error()
+                            if attempt < MAX_RETRIES - 1:
+                                delay = _backoff(attempt)
+                                print(f"  Batch {batch_num}/{total_batches}: {status_code} - retry in {delay:.1f}s")
+                                await asyncio.sleep(delay)
+                                attempt += 1
+                                continue
+                            else:
+                                await record_failure(batch)
+                                print(f"  Batch {batch_num}/{total_batches}: FAILED - {status_msg[:50]}")
+                                return
+
+                    # Success
+                    await controller.on_success()
+                    largest_ok = max(largest_ok, len(batch))
+                    stats.restored += len(batch)
+                    async with lock:
+                        restored_hashes.update(map(_id_hash, batch))
+                    print(f"  Batch {batch_num}/{total_batches}: OK ({stats.restored} restored)")
+                    completed = True
+                    break
+
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code in (401, 403, 421):
+                        print(f"\n  Auth expired (HTTP {e.response.status_code})")
+                        # Refresh credentials
+                        current_creds = await on_auth_expired()
+                        # Swap cookies on the shared client in place
+                        client.cookies.clear()
+                        client.cookies.update(current_creds.parsed_cookies)
+                        put_url = _items_url(current_creds)
+                        attempt += 1
+                        continue
+
+                    status = e.response.status_code
+                    if status in (413, 429) or status >= 500:
+                        await controller.on_error()
+
+                    # 413 means the batch is too large; a 400 is usually one
+                    # bad ID, which bisecting isolates from the rest
+                    if status in (400, 413) and split_rejected and len(batch) > 1:
+                        split = True
+                        splits += 1
+                        too_large = too_large or status == 413
                         break
 
-                    except httpx.HTTPStatusError as e:
-                        if e.response.status_code in (401, 403, 421):
-                            print(f"\n  Auth expired (HTTP {e.response.status_code})")
-                            # Refresh credentials
-                            current_creds = await on_auth_expired()
-                            # Rebuild client with new cookies
-                            cookies = _parse_cookies(current_creds.cookies)
-                            client.cookies.clear()
-                            client.cookies.update(cookies)
-                            url = f"{BASE_URL}/v1/items?{urlencode(_get_params(current_creds))}"
-                            continue
-
-                        if attempt < MAX_RETRIES - 1:
-                            delay = RETRY_DELAY * (2 ** attempt)
-                            print(f"  Batch {batch_num}/{total_batches}: HTTP {e.response.status_code} - retry in {delay}s")
-                            await asyncio.sleep(delay)
-                            continue
-
-                        stats.failed += len(batch)
-                        stats.failed_ids.extend(batch)
-                        print(f"  Batch {batch_num}/{total_batches}: FAILED - HTTP {e.response.status_code}")
+                    # A rejection that can't be split further won't change on retry
+                    if status in (400, 413):
+                        await record_failure(batch)
+                        print(f"  Batch {batch_num}/{total_batches}: FAILED - HTTP {status}")
                         return
 
-                    except Exception as e:
-                        if attempt < MAX_RETRIES - 1:
-                            delay = RETRY_DELAY * (2 ** attempt)
-                            print(f"  Batch {batch_num}/{total_batches}: {type(e).__name__} - retry in {delay}s")
-                            await asyncio.sleep(delay)
-                            continue
+                    retry_after = _retry_after(e.response)
+
+                    # Throttling has its own budget so a busy server doesn't
+                    # exhaust the retries meant for real failures
+                    if e.response.status_code == 429 and throttled < MAX_THROTTLE_RETRIES:
+                        delay = retry_after if retry_after is not None else _backoff(throttled)
+                        throttled += 1
+                        print(f"  Batch {batch_num}/{total_batches}: HTTP 429 - retry in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        continue
+
+                    if attempt < MAX_RETRIES - 1:
+                        delay = retry_after if retry_after is not None else _backoff(attempt)
+                        print(f"  Batch {batch_num}/{total_batches}: HTTP {e.response.status_code} - retry in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+
+                    await record_failure(batch)
+                    print(f"  Batch {batch_num}/{total_batches}: FAILED - HTTP {e.response.status_code}")
+                    return
 
-                        stats.failed += len(batch)
-                        stats.failed_ids.extend(batch)
-                        print(f"  Batch {batch_num}/{total_batches}: FAILED - {e}")
-                        return
+                except httpx.ReadTimeout:
+                    # The timeout already spent 60s waiting; retry straight away
+                    if attempt < MAX_RETRIES - 1:
+                        print(f"  Batch {batch_num}/{total_batches}: ReadTimeout - retrying")
+                        attempt += 1
+                        continue
 
-                if not completed:
-                    stats.failed += len(batch)
-                    stats.failed_ids.extend(batch)
-                    print(f"  Batch {batch_num}/{total_batches}: FAILED - auth refresh exhausted")
+                    await record_failure(batch)
+                    print(f"  Batch {batch_num}/{total_batches}: FAILED - read timeout")
                     return
 
-            # Save progress periodically
-            save_counter += 1
-            if save_counter % 20 == 0:
-                async with lock:
-                    progress_file.write_text(json.dumps({
-                        "restored_ids": restored_ids,
-                        "failed_ids": stats.failed_ids,
-                    }))
-
-                    elapsed = time.time() - start_time
-                    total_done = stats.restored + stats.failed
-                    if total_done > 0 and elapsed > 0:
-                        rate = total_done / elapsed
-                        remaining = len(remaining_ids) - total_done
-                        eta_min = (remaining / rate) / 60 if rate > 0 else 0
-                        pct = total_done / len(remaining_ids) * 100
-
-                        print(f"\n  === Progress: {pct:.1f}% | "
-                              f"Restored: {stats.restored} | "
-                              f"Failed: {stats.failed} | "
-                              f"ETA: {eta_min:.1f}min ===\n")
-
-    # Run all batches
-    tasks = [restore_batch(batch, i + 1) for i, batch in enumerate(batches)]
-    await asyncio.gather(*tasks)
-
-    # Final save
-    progress_file.write_text(json.dumps({
-        "restored_ids": restored_ids,
-        "failed_ids": stats.failed_ids,
-    }))
+                except (httpx.TransportError, json.JSONDecodeError) as e:
+                    # Network failures and garbled responses may succeed on retry;
+                    # anything else is a bug and propagates immediately
+                    if attempt < MAX_RETRIES - 1:
+                        delay = _backoff(attempt)
+                        print(f"  Batch {batch_num}/{total_batches}: {type(e).__name__} - retry in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        attempt += 1
+                        continue
+
+                    await record_failure(batch)
+                    print(f"  Batch {batch_num}/{total_batches}: FAILED - {e}")
+                    return
+
+        if split:
+            # The request was rejected as a whole (too large, or one bad ID);
+            # retry each half on its own so the rest still gets restored
+            mid = len(batch) // 2
+            print(f"  Batch {batch_num}/{total_batches}: rejected, splitting {len(batch)} files")
+            await asyncio.gather(
+                restore_batch(client, batch[:mid], batch_num),
+                restore_batch(client, batch[mid:], batch_num),
+            )
+            return
+
+        if not completed:
+            await record_failure(batch)
+            print(f"  Batch {batch_num}/{total_batches}: FAILED - auth refresh exhausted")
+            return
+
+        # Save progress once enough has changed or enough time has passed
+        async with lock:
+            dirty_since_flush += len(batch)
+            flush = (
+                dirty_since_flush >= FLUSH_EVERY_IDS
+                or time.monotonic() - last_flush_t > FLUSH_INTERVAL
+            )
+            if flush:
+                dirty_since_flush = 0
+                last_flush_t = time.monotonic()
+
+        if flush:
+            await save_progress()
+
+            elapsed = time.time() - start_time
+            total_done = stats.restored + stats.failed
+            if total_done > 0 and elapsed > 0:
+                rate = total_done / elapsed
+                remaining = len(remaining_ids) - total_done
+                eta_min = (remaining / rate) / 60 if rate > 0 else 0
+                pct = total_done / len(remaining_ids) * 100
+
+                print(f"\n  === Progress: {pct:.1f}% | "
+                      f"Restored: {stats.restored} | "
+                      f"Failed: {stats.failed} | "
+                      f"ETA: {eta_min:.1f}min ===\n")
+
+    # Run all batches over one pooled HTTP/2 client so in-flight requests
+    # multiplex over few connections. The pool is sized above the
+    # concurrency limit, which stays the real throttle.
+    limits = httpx.Limits(
+        max_connections=concurrency * 2,
+        max_keepalive_connections=concurrency * 2,
+    )
+    with failed_file.open("ab") as failed_out:
+        async with httpx.AsyncClient(
+            cookies=creds.parsed_cookies,
+            timeout=60.0,
+            limits=limits,
+            http2=True,
+        ) as client:
+            try:
+                # The first batch doubles as a probe: if iCloud only accepted it
+                # after splitting on 413, slice the rest to the size that went through
+                first_batch = remaining_ids[:batch_size]
+                await restore_batch(client, first_batch, 1)
+                rest = remaining_ids[len(first_batch):]
+                if largest_ok == 0 and splits:
+                    # Even single files were rejected, so the problem isn't
+                    # batch size - don't rebuild the split tree for every batch
+                    split_rejected = False
+                elif too_large and rest and 0 < largest_ok < batch_size:
+                    print(f"  Using batches of {largest_ok} files")
+                    batch_size = largest_ok
+                    total_batches = 1 + math.ceil(len(rest) / batch_size)
+
+                # Fixed pool of workers fed lazily from a bounded queue, so memory
+                # doesn't grow with the number of batches. None tells a worker to stop.
+                queue: asyncio.Queue[tuple[int, list[str]] | None] = asyncio.Queue(
+                    maxsize=concurrency * 2
+                )
+
+                async def produce() -> None:
+                    for batch_num, i in enumerate(range(0, len(rest), batch_size), start=2):
+                        await queue.put((batch_num, rest[i:i + batch_size]))
+                    for _ in range(concurrency):
+                        await queue.put(None)
+
+                async def work() -> None:
+                    while (item := await queue.get()) is not None:
+                        batch_num, batch = item
+                        await restore_batch(client, batch, batch_num)
+
+                tasks = [asyncio.create_task(produce())]
+                tasks += [asyncio.create_task(work()) for _ in range(concurrency)]
+                try:
+                    done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                    for task in done:
+                        task.result()  # Re-raise the first failure
+                finally:
+                    for task in tasks:
+                        task.cancel()
+            finally:
+                # Final save, also when interrupted
+                await save_progress(final=True)
 
     return stats
@@ -3,7 +3,7 @@
 import asyncio
 import subprocess
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from urllib.parse import parse_qs, urlparse
 
 from playwright.async_api import async_playwright, Browser, Page, BrowserContext
@@ -21,6 +21,24 @@ class Credentials:
     dsid: str
     client_build_number: str = "2546Build54"
     client_mastering_number: str = "2546Build54"
+    _parsed_cookies: dict | None = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def parsed_cookies(self) -> dict:
+        """Cookies as a dict for httpx, parsed once and cached."""
+        if self._parsed_cookies is None:
+            self._parsed_cookies = _parse_cookies(self.cookies)
+        return self._parsed_cookies
+
+
+def _parse_cookies(cookie_string: str) -> dict:
+    """Parse cookie header string into dict for httpx."""
+    cookies = {}
+    for item in cookie_string.split('; '):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            cookies[key] = value.strip('"')
+    return cookies
 
 
 def _get_chrome_path() -> str | None:
@@ -65,12 +83,17 @@ def _is_chrome_running() -> bool:
         return result.returncode == 0
 
 
-def _is_port_open(port: int) -> bool:
-    """Check if a port is open."""
-    import socket
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.settimeout(0.5)
-        return s.connect_ex(("127.0.0.1", port)) == 0
+async def _wait_port_open_async(port: int) -> None:
+    """Wait until something is listening on a local port."""
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            await asyncio.sleep(0.25)
+            continue
+        writer.close()
+        await writer.wait_closed()
+        return
 
 
 def launch_chrome_with_debugging() -> str | None:
@@ -136,16 +159,14 @@ class ICloudBrowser:
         except Exception:
             # Launch Chrome with fresh temp profile
             print("Launching Chrome...")
-            self._temp_profile = launch_chrome_with_debugging()
+            self._temp_profile = await asyncio.to_thread(launch_chrome_with_debugging)
             if not self._temp_profile:
                 return False
 
-            # Wait for Chrome to start with retries
-            for i in range(5):
-                await asyncio.sleep(1 + i)  # 1, 2, 3, 4, 5 seconds
-                if _is_port_open(9222):
-                    break
-            else:
+            # Wait for Chrome to start listening for DevTools connections
+            try:
+                await asyncio.wait_for(_wait_port_open_async(9222), timeout=15)
+            except asyncio.TimeoutError:
                 return False
 
             try:
@@ -237,6 +258,7 @@ class ICloudBrowser:
 
         if self._credentials:
             self._credentials.cookies = cookie_string
+            self._credentials._parsed_cookies = None
 
     async def refresh_credentials(self) -> Credentials:
         """Reload page to get fresh credentials.
@@ -282,5 +304,5 @@ class ICloudBrowser:
         # Clean up temp profile directory
         if self._temp_profile:
             import shutil
-            shutil.rmtree(self._temp_profile, ignore_errors=True)
+            await asyncio.to_thread(shutil.rmtree, self._temp_profile, ignore_errors=True)
             self._temp_profile = None
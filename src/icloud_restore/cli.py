@@ -1,14 +1,70 @@
 """Command-line interface for iCloud Drive file restore."""
 
+import argparse
 import asyncio
+import os
 import sys
+import threading
 from pathlib import Path
 
 from .browser import ICloudBrowser
-from .api import fetch_deleted_files, restore_files, AuthExpiredError
+from .api import (
+    fetch_deleted_files,
+    restore_files,
+    clear_checkpoint,
+    AuthExpiredError,
+    CONCURRENT_RESTORES,
+    RESTORE_BATCH_SIZE,
+)
+
+
+async def _ainput() -> str:
+    """input() that doesn't block the event loop.
+
+    Reads on a daemon thread so an abandoned prompt never holds up exit.
+    The thread uses os.read on the raw descriptor rather than input(), so it
+    holds no lock on sys.stdin that interpreter shutdown would wait for.
+
+    Raises:
+        EOFError: If stdin is closed before a line is entered
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    fd = sys.stdin.fileno()
+
+    def deliver(setter, value) -> None:
+        if not future.done():
+            setter(value)
+
+    def read() -> None:
+        chunks = []
+        try:
+            while not chunks or b"\n" not in chunks[-1]:
+                chunk = os.read(fd, 1024)
+                if not chunk:
+                    if not chunks:
+                        raise EOFError
+                    break
+                chunks.append(chunk)
+        except BaseException as e:
+            result = (future.set_exception, e)
+        else:
+            line = b"".join(chunks).decode(errors="replace").rstrip("\r\n")
+            result = (future.set_result, line)
+
+        try:
+            loop.call_soon_threadsafe(deliver, *result)
+        except RuntimeError:
+            pass  # Event loop already closed; nobody is waiting for the line
+
+    threading.Thread(target=read, daemon=True).start()
+    return await future
 
 
-async def async_main() -> int:
+async def async_main(
+    concurrency: int = CONCURRENT_RESTORES,
+    batch_size: int = RESTORE_BATCH_SIZE,
+) -> int:
     """Main async entry point."""
     print("=" * 50)
     print("  iCloud Drive File Restore")
@@ -76,10 +132,18 @@ async def async_main() -> int:
         print("Press Enter to start restore, or Ctrl+C to cancel...")
 
         try:
-            input()
+            await _ainput()
         except KeyboardInterrupt:
             print("\nCancelled.")
             return 0
+        except EOFError:
+            print("\nNo input received (stdin closed). Cancelled.")
+            return 1
+        except asyncio.CancelledError:
+            # Ctrl+C usually arrives as a cancellation of this task; let it
+            # propagate so asyncio.run can re-raise KeyboardInterrupt to main()
+            print("\nCancelled.")
+            raise
 
         # Restore files
         print("-" * 50)
@@ -96,6 +160,8 @@ async def async_main() -> int:
             item_ids,
             on_auth_expired=on_auth_expired,
             progress_file=progress_file,
+            concurrency=concurrency,
+            batch_size=batch_size,
         )
 
         # Summary
@@ -113,7 +179,7 @@ async def async_main() -> int:
 
         # Clean up checkpoint on success
         if stats.failed == 0 and checkpoint_file.exists():
-            checkpoint_file.unlink()
+            clear_checkpoint(checkpoint_file)
             print("Checkpoint file cleaned up.")
 
         return 0 if stats.failed == 0 else 1
@@ -131,9 +197,57 @@ async def async_main() -> int:
         await browser.close()
 
 
+def _positive_int(value: str) -> int:
+    """argparse type for integers >= 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def _run(coro):
+    """Run the event loop, using uvloop where it's installed (not on Windows)."""
+    if sys.platform != "win32":
+        try:
+            import uvloop
+        except ImportError:
+            pass
+        else:
+            return uvloop.run(coro)
+    return asyncio.run(coro)
+
+
 def main() -> None:
     """Entry point for the CLI."""
-    sys.exit(asyncio.run(async_main()))
+    parser = argparse.ArgumentParser(
+        prog="icloud-restore",
+        description="Restore deleted iCloud Drive files when the web UI crashes.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=_positive_int,
+        default=CONCURRENT_RESTORES,
+        help=f"maximum parallel restore requests; lowered automatically "
+             f"when iCloud throttles (default: {CONCURRENT_RESTORES})",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=_positive_int,
+        default=RESTORE_BATCH_SIZE,
+        help=f"files per restore request; batches the server rejects are "
+             f"split in half automatically (default: {RESTORE_BATCH_SIZE})",
+    )
+    args = parser.parse_args()
+
+    try:
+        sys.exit(_run(async_main(
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+        )))
+    except KeyboardInterrupt:
+        # asyncio.run re-raises Ctrl+C after cancelling async_main, which has
+        # already reported it; exit without a traceback
+        sys.exit(130)
 
 
 if __name__ == "__main__":